@@ -100,6 +100,17 @@ class CosXPlusY(BaseDiagram):
         ctx.mark_dot(p4, "D", -0.02j)
 
 
+def preview_diagrams() -> dict[str, BaseDiagram]:
+    "Diagrams shown by `python -m mathdiagrams.watch`"
+    double_chord = MultiChordDiagram()
+    double_chord.index = 1
+    return {
+        "single_chord": MultiChordDiagram(),
+        "double_chord": double_chord,
+        "cos_sum_angles": CosXPlusY(),
+    }
+
+
 def main() -> None:
     diag1 = MultiChordDiagram()
     diag1.run_and_save("single_chord.svg")
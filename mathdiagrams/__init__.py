@@ -12,6 +12,7 @@ class BaseDiagram:
         font_size: float = 16,
         center_x_pct: float = 50,
         center_y_pct: float = 50,
+        native_transform: bool = False,
     ) -> None:
         self.width = width
         self.height = height
@@ -19,22 +20,26 @@ class BaseDiagram:
         self.font_size = font_size
         self.center_x_pct = center_x_pct
         self.center_y_pct = center_y_pct
+        self.native_transform = native_transform
 
     def draw(self, ctx: NaturalContext) -> None:
         # must be implemented by the children
         pass
 
-    def run_and_save(self, filename: str) -> None:
+    def render(self, cairo_ctx: cairo.Context) -> None:
+        "Draw the canvas and the diagram into the width x height box at the user origin"
         shape = complex(self.width, self.height)
         center_x = self.width * self.center_x_pct / 100
         center_y = self.height * (100 - self.center_y_pct) / 100
         center = complex(center_x, center_y)
-        with cairo.SVGSurface(filename, self.width, self.height) as surface:
-            cairo_ctx = cairo.Context(surface)
-            cairo_ctx.set_font_size(self.font_size)
-            ctx = NaturalContext(cairo_ctx, shape, self.scale, center)
-            ctx.draw_canvas()
+        cairo_ctx.set_font_size(self.font_size)
+        ctx = NaturalContext(cairo_ctx, shape, self.scale, center, self.native_transform)
+        ctx.draw_canvas()
 
-            self.draw(ctx)
+        self.draw(ctx)
 
+    def run_and_save(self, filename: str) -> None:
+        with cairo.SVGSurface(filename, self.width, self.height) as surface:
+            cairo_ctx = cairo.Context(surface)
+            self.render(cairo_ctx)
             surface.finish()
@@ -0,0 +1,158 @@
+"""
+Fitting cubic Bézier curves to sampled points.
+
+A smooth curve sampled as hundreds of points is replaced by a few cubic segments that
+stay within a tolerance of every sample. The method is the one from Philip J. Schneider,
+"An Algorithm for Automatically Fitting Digitized Curves" (Graphics Gems, 1990): fit
+with chord length parameters, improve the parameters with Newton steps, and split at the
+worst point when that is not enough. Points are complex numbers, as everywhere else.
+"""
+
+import numpy as np
+
+# start, control 1, control 2, end
+Cubic = tuple[complex, complex, complex, complex]
+
+# Newton reparametrization is tried when the error is within this factor of tolerance
+REPARAM_FACTOR = 4
+REPARAM_STEPS = 8
+
+
+def unit(vector: complex) -> complex:
+    size = abs(vector)
+    return vector / size if size > 0 else 0j
+
+
+def bernstein(u: np.ndarray) -> np.ndarray:
+    "Cubic Bernstein basis, (count, 4)"
+    v = 1 - u
+    return np.stack([v**3, 3 * u * v**2, 3 * u**2 * v, u**3], axis=1)
+
+
+def evaluate(curve: Cubic, u: np.ndarray) -> np.ndarray:
+    return bernstein(u) @ np.array(curve)
+
+
+def derivatives(curve: Cubic, u: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    "First and second derivatives at u"
+    p0, p1, p2, p3 = curve
+    v = 1 - u
+    d1 = 3 * ((p1 - p0) * v**2 + 2 * (p2 - p1) * u * v + (p3 - p2) * u**2)
+    d2 = 6 * ((p2 - 2 * p1 + p0) * v + (p3 - 2 * p2 + p1) * u)
+    return d1, d2
+
+
+def dot(a: np.ndarray | complex, b: np.ndarray | complex) -> np.ndarray:
+    return (np.conjugate(a) * b).real
+
+
+def chord_parameters(points: np.ndarray) -> np.ndarray:
+    lengths = np.concatenate([[0], np.cumsum(np.abs(np.diff(points)))])
+    return lengths / lengths[-1]
+
+
+def least_squares(
+    points: np.ndarray, u: np.ndarray, tangent1: complex, tangent2: complex
+) -> Cubic:
+    "Cubic through the end points, with control points along the tangents"
+    start, end = complex(points[0]), complex(points[-1])
+    basis = bernstein(u)
+    a1 = tangent1 * basis[:, 1]
+    a2 = tangent2 * basis[:, 2]
+    c00 = np.sum(dot(a1, a1))
+    c01 = np.sum(dot(a1, a2))
+    c11 = np.sum(dot(a2, a2))
+    ends_only = start * (basis[:, 0] + basis[:, 1]) + end * (basis[:, 2] + basis[:, 3])
+    rest = points - ends_only
+    x0 = np.sum(dot(a1, rest))
+    x1 = np.sum(dot(a2, rest))
+
+    chord = abs(end - start)
+    det = c00 * c11 - c01 * c01
+    alpha1 = alpha2 = 0.0
+    if abs(det) > 1e-12:
+        alpha1 = (x0 * c11 - x1 * c01) / det
+        alpha2 = (c00 * x1 - c01 * x0) / det
+    if alpha1 < 1e-6 * chord or alpha2 < 1e-6 * chord:
+        # degenerate fit: fall back to the Wu/Barsky heuristic
+        alpha1 = alpha2 = chord / 3
+    control1 = complex(start + tangent1 * alpha1)
+    control2 = complex(end + tangent2 * alpha2)
+    return (start, control1, control2, end)
+
+
+def reparametrize(curve: Cubic, points: np.ndarray, u: np.ndarray) -> np.ndarray:
+    "One Newton-Raphson step towards the closest curve point for every sample"
+    diff = evaluate(curve, u) - points
+    d1, d2 = derivatives(curve, u)
+    numerator = dot(diff, d1)
+    denominator = dot(d1, d1) + dot(diff, d2)
+    step = np.divide(numerator, denominator, out=np.zeros_like(u), where=denominator != 0)
+    return np.clip(u - step, 0, 1)
+
+
+def max_error(curve: Cubic, points: np.ndarray, u: np.ndarray) -> tuple[float, int]:
+    "Largest distance of a sample from the curve, and the index of that sample"
+    distance = np.abs(evaluate(curve, u) - points)
+    distance[[0, -1]] = 0
+    index = int(np.argmax(distance))
+    return float(distance[index]), index
+
+
+def fit_cubic(points: np.ndarray, tolerance: float) -> list[Cubic]:
+    """
+    Fit a sequence of cubics to the points (a complex array), keeping every sample within
+    tolerance. The cubics join with a continuous tangent.
+    """
+    points = np.asarray(points, dtype=complex).ravel()
+    if len(points) > 1:
+        # repeated points break the chord length parameters
+        points = points[np.concatenate([[True], np.diff(points) != 0])]
+    if len(points) < 2:
+        return []
+
+    tangent1 = unit(points[1] - points[0])
+    tangent2 = unit(points[-2] - points[-1])
+    # depth first, left before right, so the result comes out in order
+    pending = [(points, tangent1, tangent2)]
+    result: list[Cubic] = []
+    while pending:
+        part, start_tangent, end_tangent = pending.pop()
+        curve, split = fit_part(part, start_tangent, end_tangent, tolerance)
+        if split is None:
+            result.append(curve)
+            continue
+        center_tangent = unit(part[split - 1] - part[split + 1])
+        if center_tangent == 0:
+            center_tangent = unit(part[split - 1] - part[split])
+        pending.append((part[split:], -center_tangent, end_tangent))
+        pending.append((part[: split + 1], start_tangent, center_tangent))
+    return result
+
+
+def fit_part(
+    points: np.ndarray, tangent1: complex, tangent2: complex, tolerance: float
+) -> tuple[Cubic, int | None]:
+    "A cubic within tolerance (split is None), or the index to split the points at"
+    start, end = complex(points[0]), complex(points[-1])
+    if len(points) == 2:
+        third = abs(end - start) / 3
+        control1 = complex(start + tangent1 * third)
+        control2 = complex(end + tangent2 * third)
+        return (start, control1, control2, end), None
+
+    u = chord_parameters(points)
+    curve = least_squares(points, u, tangent1, tangent2)
+    error, split = max_error(curve, points, u)
+    if error <= tolerance:
+        return curve, None
+
+    if error <= tolerance * REPARAM_FACTOR:
+        for _ in range(REPARAM_STEPS):
+            u = reparametrize(curve, points, u)
+            curve = least_squares(points, u, tangent1, tangent2)
+            error, split = max_error(curve, points, u)
+            if error <= tolerance:
+                return curve, None
+
+    return curve, split
@@ -0,0 +1,108 @@
+"""
+Export many diagrams into a single PDF.
+
+Diagrams can be given as any iterable (eg: a generator). Every page is emitted with
+show_page() as soon as it is drawn, so cairo writes it out and the memory use does not
+grow with the number of pages.
+"""
+
+from typing import Iterable
+
+import cairo
+
+from . import BaseDiagram, utils
+
+# A4 in points
+A4 = (595.0, 842.0)
+
+
+def export_pdf(diagrams: Iterable[BaseDiagram], filename: str) -> int:
+    """
+    One diagram per page, with the page size taken from the diagram.
+    Returns the number of pages. No file is written when there are no diagrams.
+    """
+    surface: cairo.PDFSurface | None = None
+    count = 0
+    try:
+        for diagram in diagrams:
+            if surface is None:
+                surface = cairo.PDFSurface(filename, diagram.width, diagram.height)
+            else:
+                surface.set_size(diagram.width, diagram.height)
+            ctx = cairo.Context(surface)
+            diagram.render(ctx)
+            ctx.show_page()
+            count += 1
+    finally:
+        if surface is not None:
+            surface.finish()
+
+    if surface is None:
+        raise ValueError("No diagrams to export")
+    return count
+
+
+def export_contact_sheet(
+    diagrams: Iterable[BaseDiagram],
+    filename: str,
+    columns: int = 2,
+    rows: int = 3,
+    page_size: tuple[float, float] = A4,
+    margin: float = 18,
+    background_color: str = "#fff",
+) -> int:
+    """
+    N-up pages: diagrams are scaled to fit a columns x rows grid of cells.
+    Returns the number of pages. No file is written when there are no diagrams.
+    """
+    if columns < 1 or rows < 1:
+        raise ValueError(f"Improper grid {columns=} {rows=}")
+    page_width, page_height = page_size
+    cell_width = (page_width - margin * (columns + 1)) / columns
+    cell_height = (page_height - margin * (rows + 1)) / rows
+    if cell_width <= 0 or cell_height <= 0:
+        raise ValueError(f"{margin=} leaves no room for the cells")
+
+    per_page = columns * rows
+    surface: cairo.PDFSurface | None = None
+    count = 0
+    try:
+        for count, diagram in enumerate(diagrams, start=1):
+            if surface is None:
+                surface = cairo.PDFSurface(filename, page_width, page_height)
+                ctx = cairo.Context(surface)
+            slot = (count - 1) % per_page
+            if slot == 0:
+                if count > 1:
+                    ctx.show_page()
+                ctx.save()
+                utils.set_color(ctx, background_color)
+                ctx.paint()
+                ctx.restore()
+
+            row, column = divmod(slot, columns)
+            factor = min(cell_width / diagram.width, cell_height / diagram.height)
+            # center the diagram in its cell
+            x = margin + column * (cell_width + margin)
+            x += (cell_width - diagram.width * factor) / 2
+            y = margin + row * (cell_height + margin)
+            y += (cell_height - diagram.height * factor) / 2
+
+            ctx.save()
+            ctx.translate(x, y)
+            ctx.scale(factor, factor)
+            ctx.rectangle(0, 0, diagram.width, diagram.height)
+            ctx.clip()
+            diagram.render(ctx)
+            ctx.restore()
+
+        if surface is not None:
+            ctx.show_page()
+    finally:
+        if surface is not None:
+            surface.finish()
+
+    if surface is None:
+        raise ValueError("No diagrams to export")
+    pages = (count + per_page - 1) // per_page
+    return pages
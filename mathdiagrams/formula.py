@@ -0,0 +1,163 @@
+"""
+Math formula labels as vector outlines, with a persistent on-disk cache.
+
+Labels drawn with math=True (eg: ctx.text(p, "$x+y$", math=True)) have their $...$ parts
+typeset with matplotlib mathtext, which works offline and does not need a TeX
+installation. matplotlib is only imported when a formula is not in the cache yet.
+
+Outlines are stored in device units, with the baseline-left point at the origin and the
+Y axis pointing down (like cairo text). Each entry is a small JSON file keyed on the
+formula, font, size, mathtext fontset and matplotlib version. The default location is
+~/.cache/mathdiagrams/formulas and it can be changed with the MATHDIAGRAMS_CACHE
+environment variable.
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from importlib import metadata
+from pathlib import Path
+
+from cairo import Context
+
+# ["M", x, y], ["L", x, y], ["C", x1, y1, x2, y2, x3, y3] or ["Z"]
+PathOp = list
+
+
+@dataclass
+class Outline:
+    ops: list[PathOp]
+    x_bearing: float
+    y_bearing: float
+    width: float
+    height: float
+
+
+# mathtext fontset used for the formulas (see matplotlib rcParams["mathtext.fontset"])
+DEFAULT_FONTSET = "dejavusans"
+
+
+def matplotlib_version() -> str:
+    "Installed matplotlib version, without importing it"
+    try:
+        return metadata.version("matplotlib")
+    except metadata.PackageNotFoundError:
+        return ""
+
+
+def default_cache_dir() -> Path:
+    env_dir = os.environ.get("MATHDIAGRAMS_CACHE")
+    if env_dir:
+        return Path(env_dir)
+    return Path.home() / ".cache" / "mathdiagrams" / "formulas"
+
+
+def render_outline(formula: str, font: str, size: float, fontset: str) -> Outline:
+    "Typeset the formula with matplotlib mathtext and convert it to path operations"
+    try:
+        from matplotlib import rc_context
+        from matplotlib.font_manager import FontProperties
+        from matplotlib.path import Path as MplPath
+        from matplotlib.textpath import TextPath
+    except ImportError as ex:
+        message = "Formula labels require matplotlib (pip install matplotlib)"
+        raise ImportError(message) from ex
+
+    with rc_context({"mathtext.fontset": fontset}):
+        path = TextPath((0, 0), formula, size=size, prop=FontProperties(family=font))
+    ops: list[PathOp] = []
+    current = (0.0, 0.0)
+    for verts, code in path.iter_segments(curves=True, simplify=False):
+        # flip Y: matplotlib is Y up, cairo text is Y down
+        points = [(verts[idx], -verts[idx + 1]) for idx in range(0, len(verts), 2)]
+        if code == MplPath.MOVETO:
+            ops.append(["M", *points[0]])
+        elif code == MplPath.LINETO:
+            ops.append(["L", *points[0]])
+        elif code == MplPath.CURVE3:
+            # quadratic to cubic
+            (qx, qy), (x, y) = points
+            x0, y0 = current
+            c1 = (x0 + 2 / 3 * (qx - x0), y0 + 2 / 3 * (qy - y0))
+            c2 = (x + 2 / 3 * (qx - x), y + 2 / 3 * (qy - y))
+            ops.append(["C", *c1, *c2, x, y])
+        elif code == MplPath.CURVE4:
+            ops.append(["C", *points[0], *points[1], *points[2]])
+        elif code == MplPath.CLOSEPOLY:
+            ops.append(["Z"])
+            continue
+        current = points[-1]
+
+    if len(path.vertices):
+        x_min, y_min = path.vertices.min(axis=0)
+        x_max, y_max = path.vertices.max(axis=0)
+    else:
+        x_min = y_min = x_max = y_max = 0.0
+    return Outline(
+        ops, float(x_min), float(-y_max), float(x_max - x_min), float(y_max - y_min)
+    )
+
+
+class FormulaCache:
+    def __init__(
+        self, cache_dir: Path | None = None, fontset: str = DEFAULT_FONTSET
+    ) -> None:
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.fontset = fontset
+        self.version = matplotlib_version()
+        self.memory: dict[tuple[str, str, float], Outline] = {}
+
+    def entry_path(self, formula: str, font: str, size: float) -> Path:
+        parts = [formula, font, f"{size:g}", self.fontset, self.version]
+        key = "\0".join(parts).encode()
+        return self.cache_dir / f"{hashlib.sha256(key).hexdigest()}.json"
+
+    def get(self, formula: str, font: str, size: float) -> Outline:
+        key = (formula, font, size)
+        outline = self.memory.get(key)
+        if outline is not None:
+            return outline
+
+        path = self.entry_path(formula, font, size)
+        try:
+            outline = Outline(**json.loads(path.read_text()))
+        except (OSError, ValueError, TypeError):
+            outline = render_outline(formula, font, size, self.fontset)
+            self.store(path, outline)
+
+        self.memory[key] = outline
+        return outline
+
+    def store(self, path: Path, outline: Outline) -> None:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(outline.__dict__, separators=(",", ":")))
+            tmp.replace(path)
+        except OSError:
+            pass  # a read-only cache only costs speed
+
+
+_default_cache: FormulaCache | None = None
+
+
+def get_default_cache() -> FormulaCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = FormulaCache()
+    return _default_cache
+
+
+def append_outline(ctx: Context, outline: Outline, x: float, y: float) -> None:
+    "Add the outline to the current path of ctx, with the origin moved to (x, y)"
+    for op in outline.ops:
+        kind = op[0]
+        if kind == "M":
+            ctx.move_to(op[1] + x, op[2] + y)
+        elif kind == "L":
+            ctx.line_to(op[1] + x, op[2] + y)
+        elif kind == "C":
+            ctx.curve_to(op[1] + x, op[2] + y, op[3] + x, op[4] + y, op[5] + x, op[6] + y)
+        else:
+            ctx.close_path()
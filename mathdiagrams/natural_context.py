@@ -1,10 +1,14 @@
-from dataclasses import dataclass
-from typing import Self
+import cmath
+import math
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Self
 
 import cairo
+import numpy as np
 from cairo import Context
 
-from . import utils
+from . import bezier, formula, regions, utils
 from .canvas import CanvasConfig, CanvasConfigInternal, Canvas
 
 
@@ -13,6 +17,44 @@ class NaturalContextState:
     center: complex
     scale: float
     dot_size: float
+    rotation: complex
+
+
+@dataclass
+class Symbol:
+    """
+    A sub-figure recorded once and painted many times (see NaturalContext.define_symbol)
+    """
+
+    surface: cairo.RecordingSurface
+    pattern: cairo.SurfacePattern
+    scale: float
+    # For image targets: zoom factor -> (raster, x offset, y offset)
+    rasters: dict[float, tuple[cairo.ImageSurface, float, float]] = field(
+        default_factory=dict
+    )
+
+    def raster(self, factor: float) -> tuple[cairo.ImageSurface, float, float] | None:
+        "The recording rendered once at the given zoom factor (None if it is empty)"
+        key = round(factor, 6)
+        if key in self.rasters:
+            return self.rasters[key]
+        ink_x, ink_y, ink_width, ink_height = self.surface.ink_extents()
+        if ink_width <= 0 or ink_height <= 0:
+            return None
+        # one pixel of padding for antialiasing
+        width = math.ceil(ink_width * factor) + 2
+        height = math.ceil(ink_height * factor) + 2
+        image = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+        image_ctx = cairo.Context(image)
+        image_ctx.translate(1, 1)
+        image_ctx.scale(factor, factor)
+        image_ctx.translate(-ink_x, -ink_y)
+        image_ctx.set_source_surface(self.surface)
+        image_ctx.paint()
+        image.flush()
+        self.rasters[key] = (image, ink_x * factor - 1, ink_y * factor - 1)
+        return self.rasters[key]
 
 
 @dataclass
@@ -24,13 +66,26 @@ class CanvasLimits:
 class NaturalContext:
     """
     A context that supports the natural mathematical 4 quadrant context
+
+    By default every point is mapped to page coordinates in Python (see convert()).
+    With native=True the mapping is set up once as the cairo matrix and points are
+    passed through as they are. Line widths, dashes and text stay in page units in both
+    modes.
     """
 
     def __init__(
-        self, ctx: Context, shape: complex, scale: float, center: complex | None = None
+        self,
+        ctx: Context,
+        shape: complex,
+        scale: float,
+        center: complex | None = None,
+        native: bool = False,
     ) -> None:
         self.ctx = ctx
         self.ctx.set_line_cap(cairo.LINE_CAP_ROUND)
+        self.native = native
+        # Matrix of the page space (pixels, Y down), in which the canvas is drawn
+        self.page_matrix = ctx.get_matrix()
         self.scale = scale
         self.shape = shape
 
@@ -38,14 +93,100 @@ class NaturalContext:
             center = shape / 2
         self.center = center
         self.dot_size = 0.015
+        # Unit complex number giving the orientation of the current local frame
+        self.rotation = 1 + 0j
 
+        # Limits are always expressed in the root frame
         self.limits = CanvasLimits(-center / scale, (shape - center) / scale)
         self.history: list[NaturalContextState] = []
+        self.symbols: dict[str, Symbol] = {}
+        # None means formula.get_default_cache()
+        self.formula_cache: formula.FormulaCache | None = None
+        # Page space rectangle that regions are clipped to, None to not clip
+        self.clip_box: complex | None = shape
+
+        if native:
+            self.ctx.translate(center.real, center.imag)
+            self.ctx.scale(scale, -scale)
+
+    def to_page(self, point: complex) -> tuple[float, float]:
+        "Position of the point in page space"
+        z = (point * self.rotation).conjugate() * self.scale + self.center
+        return z.real, z.imag
 
     def convert(self, point: complex) -> tuple[float, float]:
-        z = point.conjugate() * self.scale + self.center
+        "Position of the point in the user space of the cairo context"
+        if self.native:
+            return point.real, point.imag
+        # same as to_page(), inlined as this runs for every point
+        z = (point * self.rotation).conjugate() * self.scale + self.center
         return z.real, z.imag
 
+    def to_page_many(self, points: regions.Points) -> np.ndarray:
+        "Vectorized to_page(), returns a complex array"
+        points = np.asarray(points, dtype=complex)
+        return (points * self.rotation).conjugate() * self.scale + self.center
+
+    def convert_many(self, points: regions.Points) -> np.ndarray:
+        "Vectorized convert(), returns a complex array"
+        if self.native:
+            return np.asarray(points, dtype=complex)
+        return self.to_page_many(points)
+
+    @contextmanager
+    def page_space(self) -> Iterator[None]:
+        "Temporarily switch the cairo context to page space (no-op in default mode)"
+        if not self.native:
+            yield
+            return
+        self.ctx.save()
+        self.ctx.set_matrix(self.page_matrix)
+        try:
+            yield
+        finally:
+            self.ctx.restore()
+
+    def save(self) -> Self:
+        """Push the local frame (and the cairo state) onto the history"""
+        state = NaturalContextState(self.center, self.scale, self.dot_size, self.rotation)
+        self.history.append(state)
+        self.ctx.save()
+        return self
+
+    def restore(self) -> Self:
+        """Pop the local frame (and the cairo state) saved by the last save()"""
+        if not self.history:
+            raise RuntimeError("restore() called without a matching save()")
+        state = self.history.pop()
+        self.center = state.center
+        self.scale = state.scale
+        self.dot_size = state.dot_size
+        self.rotation = state.rotation
+        self.ctx.restore()
+        return self
+
+    def translate(self, offset: complex) -> Self:
+        """Move the origin of the local frame to offset (given in the current frame)"""
+        self.center = complex(*self.to_page(offset))
+        if self.native:
+            self.ctx.translate(offset.real, offset.imag)
+        return self
+
+    def rotate(self, angle: float) -> Self:
+        """Rotate the local frame anti-clockwise by angle (radians)"""
+        self.rotation *= cmath.exp(1j * angle)
+        if self.native:
+            self.ctx.rotate(angle)
+        return self
+
+    def zoom(self, factor: float) -> Self:
+        """Scale the local frame. Line widths, fonts and dots keep their size."""
+        self.scale *= factor
+        self.dot_size /= factor
+        if self.native:
+            self.ctx.scale(factor, factor)
+        return self
+
     def move_to(self, point: complex) -> Self:
         self.ctx.move_to(*self.convert(point))
         return self
@@ -54,6 +195,14 @@ class NaturalContext:
         self.ctx.line_to(*self.convert(point))
         return self
 
+    def curve_to(self, control1: complex, control2: complex, end: complex) -> Self:
+        "Cubic Bézier from the current point"
+        x1, y1 = self.convert(control1)
+        x2, y2 = self.convert(control2)
+        x3, y3 = self.convert(end)
+        self.ctx.curve_to(x1, y1, x2, y2, x3, y3)
+        return self
+
     def set_color(self, color: str) -> Self:
         utils.set_color(self.ctx, color)
         return self
@@ -62,34 +211,137 @@ class NaturalContext:
         self.ctx.set_line_width(width)
         return self
 
+    def set_dash(self, dashes: list[float], offset: float = 0) -> Self:
+        "Dash pattern in pixels, an empty list gives solid lines"
+        self.ctx.set_dash(dashes, offset)
+        return self
+
     def stroke(self) -> Self:
-        self.ctx.stroke()
+        with self.page_space():
+            self.ctx.stroke()
         return self
 
     def fill(self) -> Self:
         self.ctx.fill()
         return self
 
+    def append_points(self, points: np.ndarray, close: bool = False) -> None:
+        "Add already converted points to the current path as one polyline"
+        if len(points) == 0:
+            return
+        xs = points.real.tolist()
+        ys = points.imag.tolist()
+        self.ctx.move_to(xs[0], ys[0])
+        line_to = self.ctx.line_to
+        for x, y in zip(xs[1:], ys[1:]):
+            line_to(x, y)
+        if close:
+            self.ctx.close_path()
+
+    def polyline(self, points: regions.Points, close: bool = False) -> Self:
+        "Add a polyline through all the points (converted in one go) to the path"
+        self.append_points(self.convert_many(points), close)
+        return self
+
+    def polygon(self, points: regions.Points) -> Self:
+        return self.polyline(points, close=True)
+
+    def polygons(self, points: np.ndarray) -> Self:
+        "Add many closed polygons to the path. points is a (count, sides) complex array"
+        user = self.convert_many(points)
+        move_to, line_to = self.ctx.move_to, self.ctx.line_to
+        close_path = self.ctx.close_path
+        for row_x, row_y in zip(user.real.tolist(), user.imag.tolist()):
+            move_to(row_x[0], row_y[0])
+            for x, y in zip(row_x[1:], row_y[1:]):
+                line_to(x, y)
+            close_path()
+        return self
+
+    def segments(self, starts: regions.Points, ends: regions.Points) -> Self:
+        "Add many separate line segments (starts[i] to ends[i]) to the path"
+        user_starts = self.convert_many(starts)
+        user_ends = self.convert_many(ends)
+        move_to, line_to = self.ctx.move_to, self.ctx.line_to
+        for x1, y1, x2, y2 in zip(
+            user_starts.real.tolist(),
+            user_starts.imag.tolist(),
+            user_ends.real.tolist(),
+            user_ends.imag.tolist(),
+        ):
+            move_to(x1, y1)
+            line_to(x2, y2)
+        return self
+
     def line(self, p1: complex, p2: complex) -> Self:
         self.move_to(p1)
         self.line_to(p2)
         self.stroke()
         return self
 
+    def bezier(
+        self, start: complex, control1: complex, control2: complex, end: complex
+    ) -> Self:
+        self.move_to(start)
+        self.curve_to(control1, control2, end)
+        self.stroke()
+        return self
+
+    def smooth_curve(self, points: regions.Points, tolerance: float = 0.5) -> Self:
+        """
+        Add a curve through sampled points to the path, as a few cubic Béziers that stay
+        within tolerance (in pixels) of every sample.
+        """
+        curves = bezier.fit_cubic(np.asarray(points), tolerance / self.scale)
+        if not curves:
+            return self
+        self.move_to(curves[0][0])
+        for _start, control1, control2, end in curves:
+            self.curve_to(control1, control2, end)
+        return self
+
     def arc(self, center: complex, radius: float, angle1: float, angle2: float) -> Self:
+        if self.native:
+            # clockwise from angle2 to angle1, the same path as in the default mode
+            self.ctx.arc_negative(center.real, center.imag, radius, angle2, angle1)
+            return self
         x, y = self.convert(center)
         radius = radius * self.scale
-        self.ctx.arc(x, y, radius, -angle2, -angle1)
+        turn = cmath.phase(self.rotation)
+        self.ctx.arc(x, y, radius, -(angle2 + turn), -(angle1 + turn))
         return self
 
     def circle(self, center: complex, radius: float) -> Self:
         self.arc(center, radius, 0, utils.d2r(360))
         return self
 
+    def ellipse(
+        self, center: complex, radius_x: float, radius_y: float, angle: float = 0
+    ) -> Self:
+        "Ellipse with the X radius turned anti-clockwise by angle (radians)"
+        x, y = self.convert(center)
+        self.ctx.save()
+        self.ctx.translate(x, y)
+        if self.native:
+            self.ctx.rotate(angle)
+            self.ctx.scale(radius_x, radius_y)
+        else:
+            self.ctx.rotate(-(angle + cmath.phase(self.rotation)))
+            self.ctx.scale(radius_x * self.scale, radius_y * self.scale)
+        if self.native:
+            # clockwise, like the default mode (Y is up here)
+            self.ctx.arc_negative(0, 0, 1, utils.d2r(360), 0)
+        else:
+            self.ctx.arc(0, 0, 1, 0, utils.d2r(360))
+        # the path stays, only the matrix is restored
+        self.ctx.restore()
+        return self
+
     def draw_canvas(self, config: CanvasConfig = CanvasConfig()) -> Self:
         config_internal = CanvasConfigInternal(self.scale, self.shape, self.center)
         canvas = Canvas(config, config_internal)
-        canvas.draw(self.ctx)
+        with self.page_space():
+            canvas.draw(self.ctx)
         return self
 
     def text(
@@ -98,39 +350,75 @@ class NaturalContext:
         text: str,
         h_align: str = "left",
         v_align: str = "bottom",
+        math: bool = False,
     ) -> Self:
-        ext = self.ctx.text_extents(text)
-        scale = self.scale
+        """
+        Show text at position. With math=True, parts within $...$ are typeset as math
+        (see formula.py, needs matplotlib).
+        """
+        with self.page_space():
+            self.page_text(position, text, h_align, v_align, math)
+        return self
+
+    def page_text(
+        self, position: complex, text: str, h_align: str, v_align: str, math: bool
+    ) -> None:
+        outline = None
+        if math:
+            outline = self.formula_outline(text)
+            width, height = outline.width, outline.height
+        else:
+            ext = self.ctx.text_extents(text)
+            width, height = ext.width, ext.height
+        # Alignment is done in device space, so text stays upright in rotated frames
+        x, y = self.to_page(position)
         if h_align == "left":
             pass  # default
         elif h_align in ("mid", "middle", "center"):
-            position += complex(-ext.width / 2 / scale, 0)
+            x -= width / 2
         elif h_align == "right":
-            position += complex(-ext.width / scale, 0)
+            x -= width
         else:
             raise ValueError(f"Unknown {h_align=}")
 
         if v_align == "bottom":
             pass  # default
         elif v_align in ("mid", "middle", "center"):
-            position += complex(0, -ext.height / 2 / scale)
+            y += height / 2
         elif v_align == "top":
-            position += complex(0, -ext.height / scale)
+            y += height
         else:
             raise ValueError(f"Unknown {v_align=}")
 
-        self.move_to(position)
+        if outline is not None:
+            self.ctx.new_path()
+            formula.append_outline(self.ctx, outline, x, y)
+            self.ctx.fill()
+            return
+
+        self.ctx.move_to(x, y)
         self.ctx.show_text(text)
         self.ctx.stroke()
-        return self
 
-    def mark_dot(self, position: complex, text: str = "", shift: complex = 0j) -> Self:
+    def formula_outline(self, text: str) -> formula.Outline:
+        "Outline of a math label in the current font, from the formula cache"
+        font_face = self.ctx.get_font_face()
+        family = "DejaVu Sans"
+        if isinstance(font_face, cairo.ToyFontFace) and font_face.get_family():
+            family = font_face.get_family()
+        size = self.ctx.get_font_matrix().xx
+        cache = self.formula_cache or formula.get_default_cache()
+        return cache.get(text, family, size)
+
+    def mark_dot(
+        self, position: complex, text: str = "", shift: complex = 0j, math: bool = False
+    ) -> Self:
         self.circle(position, self.dot_size).fill()
         position += shift
         if text:
             h_align = "left" if shift.real >= 0 else "right"
             v_align = "bottom" if shift.imag >= 0 else "top"
-            self.text(position, text, h_align=h_align, v_align=v_align)
+            self.text(position, text, h_align=h_align, v_align=v_align, math=math)
         return self
 
     def mark_angle(
@@ -142,10 +430,120 @@ class NaturalContext:
         text: str,
         extend: float = 0.01,
         turn: float = 0,
+        math: bool = False,
     ) -> Self:
         self.arc(center, radius, angle1, angle2)
         self.stroke()
         angle_avg = (angle1 + angle2) / 2
         shift = utils.p2z(radius + extend, angle_avg + turn)
-        self.text(center + shift, text)
+        self.text(center + shift, text, math=math)
+        return self
+
+    def define_symbol(self, name: str, draw: Callable[["NaturalContext"], None]) -> Self:
+        """
+        Record a sub-figure once. draw() gets a context whose origin is the symbol anchor.
+        The recording starts with the current color, line width and font.
+        """
+        surface = cairo.RecordingSurface(cairo.CONTENT_COLOR_ALPHA, None)
+        cairo_ctx = cairo.Context(surface)
+        cairo_ctx.set_source(self.ctx.get_source())
+        cairo_ctx.set_line_width(self.ctx.get_line_width())
+        cairo_ctx.set_font_face(self.ctx.get_font_face())
+        cairo_ctx.set_font_matrix(self.ctx.get_font_matrix())
+
+        sub_ctx = NaturalContext(cairo_ctx, self.shape, self.scale, 0j, self.native)
+        sub_ctx.dot_size = self.dot_size
+        sub_ctx.formula_cache = self.formula_cache
+        # the origin is the anchor, the symbol may be painted anywhere on the canvas
+        sub_ctx.clip_box = None
+        draw(sub_ctx)
+
+        self.symbols[name] = Symbol(surface, cairo.SurfacePattern(surface), self.scale)
+        return self
+
+    def use_symbol(
+        self, name: str, position: complex = 0j, angle: float = 0, scale: float = 1
+    ) -> Self:
+        """
+        Paint a symbol defined with define_symbol(). On vector targets the recording is
+        shared by all the copies (SVG output references it with <use>). On image targets
+        the symbol is rasterized once per zoom factor and the copies only blit it.
+        """
+        if name not in self.symbols:
+            raise ValueError(f"Unknown symbol {name=}")
+        symbol = self.symbols[name]
+        x, y = self.to_page(position)
+        turn = angle + cmath.phase(self.rotation)
+        factor = scale * self.scale / symbol.scale
+
+        self.ctx.save()
+        self.ctx.set_matrix(self.page_matrix)
+        self.ctx.translate(x, y)
+        self.ctx.rotate(-turn)
+        if isinstance(self.ctx.get_target(), cairo.ImageSurface):
+            # rasterize at the device resolution, so the bitmap is never upscaled
+            pixels = self.pixel_scale()
+            raster = symbol.raster(factor * pixels)
+            if raster is not None:
+                image, offset_x, offset_y = raster
+                self.ctx.scale(1 / pixels, 1 / pixels)
+                self.ctx.set_source_surface(image, offset_x, offset_y)
+                self.ctx.paint()
+        else:
+            self.ctx.scale(factor, factor)
+            self.ctx.set_source(symbol.pattern)
+            self.ctx.paint()
+        self.ctx.restore()
+        return self
+
+    def pixel_scale(self) -> float:
+        "Device pixels per unit of page space (page matrix and device scale)"
+        matrix = self.page_matrix
+        device_x, device_y = self.ctx.get_target().get_device_scale()
+        page = math.sqrt(abs(matrix.xx * matrix.yy - matrix.xy * matrix.yx))
+        return page * max(device_x, device_y)
+
+    def region(self, region: regions.Region, clip: bool = True) -> Self:
+        """
+        Add a region (see regions.py) to the path as one compound path. By default, it is
+        clipped to the canvas (not inside symbols). The path must be filled (or clipped)
+        with the non-zero winding rule, cairo's default; with FILL_RULE_EVEN_ODD overlaps
+        become holes.
+        """
+        page_rings = [self.to_page_many(ring) for ring in region.rings]
+        if clip and self.clip_box is not None:
+            width, height = self.clip_box.real, self.clip_box.imag
+            canvas = np.array([0, width, complex(width, height), complex(0, height)])
+            page_rings = [regions.clip_ring(ring, canvas) for ring in page_rings]
+        with self.page_space():
+            for ring in page_rings:
+                if len(ring) >= 3:
+                    self.append_points(ring, close=True)
+        return self
+
+    def hatch(
+        self, region: regions.Region, spacing: float = 0.05, angle: float = utils.d2r(45)
+    ) -> Self:
+        "Stroke parallel lines (spacing in natural units) inside the region"
+        if spacing <= 0:
+            raise ValueError(f"Hatch {spacing=} must be positive")
+        if not region.rings:
+            return self
+        left_bottom, right_top = region.bounds()
+        middle = (left_bottom + right_top) / 2
+        half = abs(right_top - left_bottom) / 2
+        along = cmath.exp(1j * angle)
+        across = along * 1j
+        offsets = np.arange(-half, half + spacing, spacing)
+        starts = middle + offsets * across - half * along
+        ends = starts + 2 * half * along
+
+        self.ctx.save()
+        self.ctx.set_fill_rule(cairo.FILL_RULE_WINDING)
+        self.ctx.new_path()
+        self.region(region)
+        self.ctx.clip()
+        self.segments(starts, ends)
+        self.stroke()
+        self.ctx.restore()
         return self
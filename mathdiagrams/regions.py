@@ -0,0 +1,208 @@
+"""
+Regions for shading, built from polygons and circles.
+
+A region is a list of rings (closed polygons as complex numpy arrays) filled with the
+non-zero winding rule. Outer boundaries run anti-clockwise and holes run clockwise, so:
+
+- union is the concatenation of the rings
+- intersection clips every ring with a convex shape (Sutherland-Hodgman, vectorized
+  over all the vertices of a ring for each clip edge)
+- difference adds the intersection with the winding reversed
+
+Intersection and difference need one of the two operands to be a single convex ring
+(eg: a polygon like a triangle, a disk, a circular segment).
+
+    shade = regions.disk(0, 1) - regions.polygon([1, 1j, -1])
+    ctx.set_color("#3b36").region(shade).fill()
+"""
+
+import math
+from typing import Sequence
+
+import numpy as np
+
+Ring = np.ndarray
+Points = Sequence[complex] | np.ndarray
+
+# Max distance between a circle and its polygon, in natural units
+DEFAULT_TOLERANCE = 0.001
+
+
+def as_ring(points: Points) -> Ring:
+    ring = np.asarray(points, dtype=complex).ravel()
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring = ring[:-1]
+    return ring
+
+
+def signed_area(ring: Ring) -> float:
+    "Positive for anti-clockwise rings"
+    return 0.5 * float(np.sum((ring.conjugate() * np.roll(ring, -1)).imag))
+
+
+def anticlockwise(ring: Ring) -> Ring:
+    return ring[::-1] if signed_area(ring) < 0 else ring
+
+
+def is_convex(ring: Ring) -> bool:
+    edges = np.roll(ring, -1) - ring
+    turns = (edges.conjugate() * np.roll(edges, -1)).imag
+    return bool(np.all(turns >= -1e-12) or np.all(turns <= 1e-12))
+
+
+def clip_ring(ring: Ring, clip: Ring) -> Ring:
+    "Clip a ring (any shape) with a convex anti-clockwise ring"
+    out = ring
+    for start, end in zip(clip, np.roll(clip, -1)):
+        if len(out) == 0:
+            break
+        # > 0 on the left of the clip edge, which is the inside
+        side = ((end - start).conjugate() * (out - start)).imag
+        inside = side >= 0
+        next_out = np.roll(out, -1)
+        next_side = np.roll(side, -1)
+        crossing = inside != np.roll(inside, -1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # only used where crossing, the rest may be nan
+            t = side / (side - next_side)
+            meet = out + t * (next_out - out)
+        # for each edge: its start vertex if inside, then the crossing point if any
+        candidates = np.stack([out, meet], axis=1)
+        keep = np.stack([inside, crossing], axis=1)
+        out = candidates[keep]
+    return out
+
+
+def arc_count(radius: float, angle: float, tolerance: float) -> int:
+    "Number of segments needed to keep an arc within tolerance"
+    if radius <= tolerance:
+        return 4
+    step = 2 * math.acos(1 - tolerance / radius)
+    return max(4, math.ceil(abs(angle) / step))
+
+
+def arc_points(
+    center: complex,
+    radius: float,
+    angle1: float,
+    angle2: float,
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> np.ndarray:
+    count = arc_count(radius, angle2 - angle1, tolerance)
+    angles = np.linspace(angle1, angle2, count + 1)
+    return center + radius * np.exp(1j * angles)
+
+
+class Region:
+    def __init__(self, rings: list[Ring] | None = None) -> None:
+        self.rings = [ring for ring in rings or [] if len(ring) >= 3]
+
+    def convex_ring(self) -> Ring | None:
+        if len(self.rings) == 1 and is_convex(self.rings[0]):
+            return self.rings[0]
+        return None
+
+    def bounds(self) -> tuple[complex, complex]:
+        "Left-bottom and right-top corners"
+        points = np.concatenate(self.rings) if self.rings else np.zeros(1, dtype=complex)
+        return (
+            complex(points.real.min(), points.imag.min()),
+            complex(points.real.max(), points.imag.max()),
+        )
+
+    def __or__(self, other: "Region") -> "Region":
+        return union(self, other)
+
+    def __and__(self, other: "Region") -> "Region":
+        return intersection(self, other)
+
+    def __sub__(self, other: "Region") -> "Region":
+        return difference(self, other)
+
+
+def polygon(points: Points) -> Region:
+    return Region([anticlockwise(as_ring(points))])
+
+
+def disk(center: complex, radius: float, tolerance: float = DEFAULT_TOLERANCE) -> Region:
+    ring = arc_points(center, radius, 0, 2 * math.pi, tolerance)[:-1]
+    return Region([ring])
+
+
+def sector(
+    center: complex,
+    radius: float,
+    angle1: float,
+    angle2: float,
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> Region:
+    "Pie slice from angle1 to angle2 (anti-clockwise)"
+    ring = np.append(arc_points(center, radius, angle1, angle2, tolerance), center)
+    return polygon(ring)
+
+
+def segment(
+    center: complex,
+    radius: float,
+    angle1: float,
+    angle2: float,
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> Region:
+    "Region between the arc from angle1 to angle2 (anti-clockwise) and its chord"
+    return polygon(arc_points(center, radius, angle1, angle2, tolerance))
+
+
+def between(curve1: Points, curve2: Points) -> Region:
+    """
+    Region between two curves, eg: y=f(x) and y=g(x) sampled at the same x values.
+    The region is split where the curves cross, so every part runs anti-clockwise.
+    Curves with different numbers of samples are not split and must not cross.
+    """
+    points1 = np.asarray(curve1, dtype=complex).ravel()
+    points2 = np.asarray(curve2, dtype=complex).ravel()
+    if len(points1) != len(points2):
+        return polygon(np.concatenate([points1, points2[::-1]]))
+
+    gap = (points1 - points2).imag
+    # (position along the samples, meeting point) for every place the curves meet
+    cuts = [(float(idx), points1[idx]) for idx in np.flatnonzero(gap == 0)]
+    for idx in np.flatnonzero(gap[:-1] * gap[1:] < 0):
+        t = gap[idx] / (gap[idx] - gap[idx + 1])
+        cuts.append((idx + t, points1[idx] + t * (points1[idx + 1] - points1[idx])))
+    cuts.sort(key=lambda cut: cut[0])
+
+    rings = []
+    first, start = 0, np.zeros(0, dtype=complex)
+    for position, point in cuts + [(float(len(gap)), None)]:
+        # samples strictly before the cut (up to it when there is no meeting point)
+        last = math.ceil(position)
+        end = np.zeros(0, dtype=complex) if point is None else np.array([point])
+        ring = np.concatenate(
+            [start, points1[first:last], end, points2[first:last][::-1]]
+        )
+        rings.append(anticlockwise(ring))
+        first = math.floor(position) + 1
+        start = end
+    return Region(rings)
+
+
+def union(region1: Region, region2: Region) -> Region:
+    return Region(region1.rings + region2.rings)
+
+
+def intersection(region1: Region, region2: Region) -> Region:
+    clip = region2.convex_ring()
+    if clip is None:
+        clip = region1.convex_ring()
+        region1 = region2
+    if clip is None:
+        raise ValueError("Intersection needs one operand to be a single convex shape")
+    clip = anticlockwise(clip)
+    return Region([clip_ring(ring, clip) for ring in region1.rings])
+
+
+def difference(region1: Region, region2: Region) -> Region:
+    if region2.convex_ring() is None:
+        raise ValueError("Difference needs the second operand to be a single convex shape")
+    common = intersection(region1, region2)
+    return Region(region1.rings + [ring[::-1] for ring in common.rings])
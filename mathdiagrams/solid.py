@@ -0,0 +1,271 @@
+"""
+3D solids (cubes, spheres, cones, ...) projected onto the natural context.
+
+All the vertices of a scene are projected with one matrix multiply. Faces are depth
+sorted (painter's algorithm) and only the faces turned towards the camera are filled.
+Edges of the visible faces are drawn solid, the remaining ones dashed. Each solid is
+drawn whole, from the farthest to the nearest, so scenes are exact for convex solids that
+do not interpenetrate (see Scene.draw).
+
+    scene = solid.Scene()
+    scene.add(solid.cube(), face_color="#48c4")
+    scene.draw(ctx, solid.PerspectiveCamera((3, -4, 2)))
+"""
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+import numpy as np
+
+from .natural_context import NaturalContext
+
+Vector = tuple[float, float, float] | np.ndarray
+
+
+@dataclass
+class Mesh:
+    # (count, 3) array of points
+    vertices: np.ndarray
+    # (count, sides) array of vertex indices, anti-clockwise when seen from outside
+    faces: np.ndarray
+
+    def moved(self, offset: Vector) -> "Mesh":
+        return Mesh(self.vertices + np.asarray(offset, dtype=float), self.faces)
+
+
+def cube(size: float = 1, center: Vector = (0, 0, 0)) -> Mesh:
+    corners = np.array(
+        [
+            [-1, -1, -1],
+            [1, -1, -1],
+            [1, 1, -1],
+            [-1, 1, -1],
+            [-1, -1, 1],
+            [1, -1, 1],
+            [1, 1, 1],
+            [-1, 1, 1],
+        ],
+        dtype=float,
+    )
+    faces = np.array(
+        [
+            [0, 3, 2, 1],
+            [4, 5, 6, 7],
+            [0, 1, 5, 4],
+            [2, 3, 7, 6],
+            [3, 0, 4, 7],
+            [1, 2, 6, 5],
+        ]
+    )
+    return Mesh(corners * size / 2, faces).moved(center)
+
+
+def sphere(
+    radius: float = 1, center: Vector = (0, 0, 0), rings: int = 12, segments: int = 24
+) -> Mesh:
+    "Latitude-longitude sphere made of quads (the ones at the poles are triangles)"
+    theta = np.linspace(0, np.pi, rings + 1)[:, None]
+    phi = np.linspace(0, 2 * np.pi, segments, endpoint=False)[None, :]
+    vertices = np.stack(
+        [
+            np.sin(theta) * np.cos(phi),
+            np.sin(theta) * np.sin(phi),
+            np.cos(theta) * np.ones_like(phi),
+        ],
+        axis=-1,
+    ).reshape(-1, 3)
+
+    i = np.arange(rings)[:, None]
+    j = np.arange(segments)[None, :]
+    j_next = (j + 1) % segments
+    faces = np.stack(
+        [
+            i * segments + j,
+            (i + 1) * segments + j,
+            (i + 1) * segments + j_next,
+            i * segments + j_next,
+        ],
+        axis=-1,
+    ).reshape(-1, 4)
+    return Mesh(vertices * radius, faces).moved(center)
+
+
+def cone(
+    radius: float = 1, height: float = 1, center: Vector = (0, 0, 0), segments: int = 32
+) -> Mesh:
+    "Cone with the base centered at center and the apex above it (along Z)"
+    phi = np.linspace(0, 2 * np.pi, segments, endpoint=False)
+    base = np.stack([np.cos(phi), np.sin(phi), np.zeros_like(phi)], axis=-1) * radius
+    apex = segments
+    base_center = segments + 1
+    vertices = np.vstack([base, [[0, 0, height]], [[0, 0, 0]]])
+
+    j = np.arange(segments)
+    j_next = (j + 1) % segments
+    sides = np.stack([j, j_next, np.full(segments, apex)], axis=-1)
+    bottom = np.stack([np.full(segments, base_center), j_next, j], axis=-1)
+    return Mesh(vertices, np.vstack([sides, bottom])).moved(center)
+
+
+class Camera(ABC):
+    """
+    Looks from position towards target. up gives the direction that appears upwards.
+    """
+
+    def __init__(
+        self, position: Vector, target: Vector = (0, 0, 0), up: Vector = (0, 0, 1)
+    ) -> None:
+        self.position = np.asarray(position, dtype=float)
+        forward = np.asarray(target, dtype=float) - self.position
+        distance = np.linalg.norm(forward)
+        if distance < 1e-12:
+            raise ValueError(f"Camera {position=} is the same as the {target=}")
+        forward /= distance
+        right = np.cross(forward, np.asarray(up, dtype=float))
+        if np.linalg.norm(right) < 1e-12:
+            raise ValueError(f"Camera {up=} is parallel to the view direction")
+        right /= np.linalg.norm(right)
+        true_up = np.cross(right, forward)
+        # rows: camera X (right), Y (up) and Z (depth) axes
+        self.basis = np.stack([right, true_up, forward])
+
+    def view(self, points: np.ndarray) -> np.ndarray:
+        "Points in camera coordinates, (count, 3)"
+        return (points - self.position) @ self.basis.T
+
+    @abstractmethod
+    def project(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        "Returns the 2D points (complex) and their depth"
+
+
+class OrthographicCamera(Camera):
+    def __init__(
+        self,
+        position: Vector,
+        target: Vector = (0, 0, 0),
+        up: Vector = (0, 0, 1),
+        zoom: float = 1,
+    ) -> None:
+        super().__init__(position, target, up)
+        self.zoom = zoom
+
+    def project(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        view = self.view(points)
+        return self.zoom * (view[:, 0] + 1j * view[:, 1]), view[:, 2]
+
+
+class PerspectiveCamera(Camera):
+    def __init__(
+        self,
+        position: Vector,
+        target: Vector = (0, 0, 0),
+        up: Vector = (0, 0, 1),
+        focal_length: float = 3,
+        near: float = 1e-3,
+    ) -> None:
+        super().__init__(position, target, up)
+        self.focal_length = focal_length
+        self.near = near
+
+    def project(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        view = self.view(points)
+        depth = view[:, 2]
+        # points behind the camera become nan, their faces are skipped
+        depth_or_nan = np.where(depth > self.near, depth, np.nan)
+        flat = (view[:, 0] + 1j * view[:, 1]) * self.focal_length / depth_or_nan
+        return flat, depth
+
+
+@dataclass
+class SceneItem:
+    mesh: Mesh
+    face_color: str
+    edge_color: str
+    hidden_color: str
+
+
+class Scene:
+    def __init__(self) -> None:
+        self.items: list[SceneItem] = []
+
+    def add(
+        self,
+        mesh: Mesh,
+        face_color: str = "#4488cc44",
+        edge_color: str = "#aaa",
+        hidden_color: str = "#666",
+    ) -> "Scene":
+        """
+        Add a convex solid. Empty colors skip the faces, visible edges or hidden edges
+        respectively.
+        """
+        self.items.append(SceneItem(mesh, face_color, edge_color, hidden_color))
+        return self
+
+    def draw(self, ctx: NaturalContext, camera: Camera, dash: float = 4) -> None:
+        """
+        Solids are drawn whole (faces, hidden edges, then visible edges), from the
+        farthest to the nearest by mean depth. This is exact for convex solids that do
+        not interpenetrate and can be ordered by depth. Edges of a solid covered by a
+        nearer one are painted over, not dashed.
+        """
+        if not self.items:
+            return
+        # one projection for all the vertices of the scene
+        vertices = np.vstack([item.mesh.vertices for item in self.items])
+        points, depth = camera.project(vertices)
+        bounds = np.cumsum([0] + [len(item.mesh.vertices) for item in self.items])
+
+        item_depth = []
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            part = depth[first:last][np.isfinite(points[first:last])]
+            item_depth.append(part.mean() if len(part) else -np.inf)
+        # colors and dashes of the solids do not leak into the caller's context
+        ctx.save()
+        for idx in np.argsort(-np.array(item_depth), kind="stable"):
+            first, last = bounds[idx], bounds[idx + 1]
+            item_points, item_depths = points[first:last], depth[first:last]
+            self.draw_item(ctx, self.items[idx], item_points, item_depths, dash)
+        ctx.restore()
+
+    def draw_item(
+        self,
+        ctx: NaturalContext,
+        item: SceneItem,
+        points: np.ndarray,
+        depth: np.ndarray,
+        dash: float,
+    ) -> None:
+        faces = item.mesh.faces
+        face_points = points[faces]
+        valid = np.all(np.isfinite(face_points), axis=1)
+        following = np.roll(face_points, -1, axis=1)
+        area = np.sum((face_points.conjugate() * following).imag, axis=1)
+        front = valid & (area > 0)
+
+        # painter's algorithm: far faces first, all in one fill
+        front_idx = np.flatnonzero(front)
+        face_depth = depth[faces[front_idx]].mean(axis=1)
+        order = front_idx[np.argsort(-face_depth, kind="stable")]
+        if item.face_color and len(order):
+            ctx.set_color(item.face_color).polygons(face_points[order]).fill()
+
+        sides = faces.shape[1]
+        starts = faces.ravel()
+        ends = np.roll(faces, -1, axis=1).ravel()
+        keep = np.repeat(valid, sides) & (starts != ends)
+        if not np.any(keep):
+            return
+        edges = np.sort(np.stack([starts[keep], ends[keep]], axis=1), axis=1)
+        unique, inverse = np.unique(edges, axis=0, return_inverse=True)
+        visible = np.zeros(len(unique), dtype=bool)
+        np.logical_or.at(visible, inverse.ravel(), np.repeat(front, sides)[keep])
+
+        if item.hidden_color:
+            hidden = unique[~visible]
+            ctx.set_color(item.hidden_color).set_dash([dash, dash])
+            ctx.segments(points[hidden[:, 0]], points[hidden[:, 1]]).stroke()
+        if item.edge_color:
+            shown = unique[visible]
+            ctx.set_color(item.edge_color).set_dash([])
+            ctx.segments(points[shown[:, 0]], points[shown[:, 1]]).stroke()
@@ -0,0 +1,413 @@
+"""
+Live preview of diagram modules.
+
+    python -m mathdiagrams.watch examples/trignometry/cos_x_plus_y_1.py
+
+Diagrams are discovered in the given files (BaseDiagram subclasses, or the dict returned
+by an optional module level `preview_diagrams()` function). The files are polled for
+changes and re-executed in the same interpreter. The local modules they import (the
+ones under the folders of the watched files) are reloaded when they change, along with
+the local modules importing them. Only diagrams whose source, imported local code or
+attributes changed are rendered again. The results are served on an auto-refreshing
+page, named <file stem>.<diagram>.
+"""
+
+import argparse
+import ast
+import hashlib
+import importlib.util
+import inspect
+import json
+import site
+import sys
+import sysconfig
+import tempfile
+import threading
+import time
+import traceback
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import ModuleType
+
+from . import BaseDiagram
+
+PREVIEW_PREFIX = "_mathdiagrams_preview_"
+# Modules under these folders are never reloaded, even when under a watched folder
+LIBRARY_DIRS = [
+    Path(folder).resolve()
+    for folder in [
+        *(sysconfig.get_paths()[key] for key in ("stdlib", "platstdlib", "purelib")),
+        sysconfig.get_paths()["platlib"],
+        *site.getsitepackages(),
+        site.getusersitepackages(),
+    ]
+] + [Path(__file__).resolve().parent]
+
+INDEX_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>mathdiagrams preview</title>
+<style>
+body { background: #000; color: #aaa; font-family: sans-serif; }
+figure { display: inline-block; margin: 8px; }
+pre { color: #f55; }
+</style>
+</head>
+<body>
+<div id="errors"></div>
+<div id="diagrams"></div>
+<script>
+let seen = {};
+async function poll() {
+    try {
+        const response = await fetch("state.json", {cache: "no-store"});
+        const state = await response.json();
+        const errors = document.getElementById("errors");
+        errors.innerHTML = "";
+        for (const message of state.errors) {
+            const pre = document.createElement("pre");
+            pre.textContent = message;
+            errors.appendChild(pre);
+        }
+        const box = document.getElementById("diagrams");
+        for (const [name, version] of Object.entries(state.diagrams)) {
+            let img = document.getElementById(name);
+            if (!img) {
+                const figure = document.createElement("figure");
+                img = document.createElement("img");
+                img.id = name;
+                const caption = document.createElement("figcaption");
+                caption.textContent = name;
+                figure.append(img, caption);
+                box.appendChild(figure);
+            }
+            if (seen[name] !== version) {
+                img.src = name + ".svg?v=" + version;
+                seen[name] = version;
+            }
+        }
+    } catch (ex) {
+        // server restarting or state being written; try again
+    }
+    setTimeout(poll, 250);
+}
+poll();
+</script>
+</body>
+</html>
+"""
+
+
+def load_module(path: Path) -> ModuleType:
+    name = f"{PREVIEW_PREFIX}{path.stem}"
+    spec = importlib.util.spec_from_file_location(name, path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Cannot import {path}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def local_file(module: ModuleType, roots: set[Path]) -> Path | None:
+    "Source file of a module under one of the roots and not part of a library, else None"
+    if module.__name__.startswith(PREVIEW_PREFIX):
+        return None
+    filename = getattr(module, "__file__", None)
+    if not filename or not filename.endswith(".py"):
+        return None
+    path = Path(filename).resolve()
+    if not any(path.is_relative_to(folder) for folder in roots):
+        return None
+    if any(path.is_relative_to(folder) for folder in LIBRARY_DIRS):
+        return None
+    return path
+
+
+def local_modules(roots: set[Path]) -> dict[str, Path]:
+    "Module name -> file, for the local modules imported so far"
+    result = {}
+    for name, module in list(sys.modules.items()):
+        path = local_file(module, roots) if module is not None else None
+        if path is not None:
+            result[name] = path
+    return result
+
+
+def imported_names(path: Path, package: str | None) -> set[str]:
+    "Names of the modules imported by the source file (parsed, not executed)"
+    try:
+        tree = ast.parse(path.read_text())
+    except (OSError, SyntaxError, ValueError):
+        return set()
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                parts = alias.name.split(".")
+                names.update(".".join(parts[: idx + 1]) for idx in range(len(parts)))
+        elif isinstance(node, ast.ImportFrom):
+            try:
+                base = importlib.util.resolve_name(
+                    "." * node.level + (node.module or ""), package
+                )
+            except (ImportError, ValueError):
+                continue
+            names.add(base)
+            # from package import module
+            names.update(f"{base}.{alias.name}" for alias in node.names)
+    return names
+
+
+def find_diagrams(module: ModuleType) -> dict[str, BaseDiagram]:
+    hook = getattr(module, "preview_diagrams", None)
+    if callable(hook):
+        return dict(hook())
+
+    diagrams = {}
+    for name, obj in vars(module).items():
+        if not inspect.isclass(obj) or not issubclass(obj, BaseDiagram):
+            continue
+        if obj.__module__ != module.__name__:
+            continue  # imported, not defined here
+        if needs_arguments(obj):
+            continue  # eg: an intermediate base class
+        diagrams[name] = obj()
+    return diagrams
+
+
+def needs_arguments(cls: type) -> bool:
+    "True for classes that cannot be created without arguments (or are abstract)"
+    if inspect.isabstract(cls):
+        return True
+    try:
+        signature = inspect.signature(cls)
+    except (TypeError, ValueError):
+        return False
+    required = (
+        inspect.Parameter.POSITIONAL_ONLY,
+        inspect.Parameter.POSITIONAL_OR_KEYWORD,
+        inspect.Parameter.KEYWORD_ONLY,
+    )
+    return any(
+        param.default is param.empty and param.kind in required
+        for param in signature.parameters.values()
+    )
+
+
+def shared_source(module: ModuleType, source: str) -> str:
+    "Source of the module excluding the bodies of the diagram classes"
+    lines = source.splitlines(keepends=True)
+    for obj in vars(module).values():
+        if not inspect.isclass(obj) or not issubclass(obj, BaseDiagram):
+            continue
+        if obj.__module__ != module.__name__:
+            continue
+        block, start = inspect.getsourcelines(obj)
+        for idx in range(start - 1, start - 1 + len(block)):
+            lines[idx] = "\n"
+    return "".join(lines)
+
+
+def fingerprint(diagram: BaseDiagram, common: str) -> str:
+    "Identifies what went into a render: the diagram code, shared code and attributes"
+    digest = hashlib.sha1(common.encode())
+    for cls in type(diagram).__mro__:
+        if cls is BaseDiagram:
+            break
+        try:
+            digest.update(inspect.getsource(cls).encode())
+        except (OSError, TypeError):
+            digest.update(cls.__qualname__.encode())
+    digest.update(repr(sorted(vars(diagram).items())).encode())
+    return digest.hexdigest()[:16]
+
+
+class Previewer:
+    def __init__(self, paths: list[Path], out_dir: Path) -> None:
+        self.paths = paths
+        self.out_dir = out_dir
+        # modules under these folders are local, they are reloaded when they change
+        self.roots = {path.parent for path in paths}
+        self.mtimes: dict[Path, float] = {}
+        # watched file -> local module files it imported (directly or not)
+        self.dependencies: dict[Path, set[Path]] = {}
+        # diagram name -> fingerprint of the last successful render
+        self.rendered: dict[str, str] = {}
+        self.owners: dict[Path, list[str]] = {}
+        self.errors: dict[Path, str] = {}
+        (out_dir / "index.html").write_text(INDEX_HTML)
+
+    def modified(self, path: Path) -> bool:
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return False  # editors may delete and re-create on save
+        if self.mtimes.get(path) == mtime:
+            return False
+        self.mtimes[path] = mtime
+        return True
+
+    def changed_helpers(self) -> set[Path]:
+        "Local modules imported by the watched files that changed"
+        helpers = set().union(*self.dependencies.values()) - set(self.paths)
+        return {path for path in helpers if self.modified(path)}
+
+    def changed_paths(self, changed_helpers: set[Path]) -> list[Path]:
+        "Watched files that changed themselves or through a local module they import"
+        changed = {path for path in self.paths if self.modified(path)}
+        for path in self.paths:
+            if self.dependencies.get(path, set()) & changed_helpers:
+                changed.add(path)
+        return [path for path in self.paths if path in changed]
+
+    def module_imports(self) -> dict[str, set[str]]:
+        "Local module name -> names of the modules it imports"
+        return {
+            name: imported_names(path, sys.modules[name].__package__)
+            for name, path in local_modules(self.roots).items()
+        }
+
+    def evict(self, changed_helpers: set[Path]) -> None:
+        """
+        Drop the changed local modules and the local modules importing them (directly
+        or not) from sys.modules, so the next import runs them again. The other modules
+        stay loaded.
+        """
+        if not changed_helpers:
+            return
+        local = local_modules(self.roots)
+        imports = self.module_imports()
+        stale = {name for name, path in local.items() if path in changed_helpers}
+        grown = True
+        while grown:
+            importers = {name for name, names in imports.items() if names & stale}
+            grown = not importers <= stale
+            stale |= importers
+        for name in stale:
+            del sys.modules[name]
+
+    def find_dependencies(self, path: Path) -> set[Path]:
+        "Files of the local modules the watched file imports, directly or not"
+        local = local_modules(self.roots)
+        imports = self.module_imports()
+        pending = imported_names(path, None)
+        seen: set[str] = set()
+        while pending:
+            name = pending.pop()
+            if name in seen or name not in local:
+                continue
+            seen.add(name)
+            pending |= imports[name]
+        return {local[name] for name in seen}
+
+    def refresh(self, path: Path) -> None:
+        start = time.perf_counter()
+        try:
+            source = path.read_text()
+            module = load_module(path)
+            dependencies = self.find_dependencies(path)
+            self.dependencies[path] = dependencies
+            for dependency in dependencies:
+                self.modified(dependency)
+            # the file stem keeps the names from different files apart
+            found = find_diagrams(module)
+            diagrams = {f"{path.stem}.{name}": diagram for name, diagram in found.items()}
+            common = shared_source(module, source)
+            for dependency in sorted(dependencies):
+                common += dependency.read_text()
+        except Exception:
+            self.errors[path] = traceback.format_exc()
+            print(self.errors[path], file=sys.stderr)
+            return
+
+        self.errors.pop(path, None)
+        for name in self.owners.get(path, []):
+            if name not in diagrams:
+                self.rendered.pop(name, None)
+        self.owners[path] = list(diagrams)
+
+        count = 0
+        for name, diagram in diagrams.items():
+            key = fingerprint(diagram, common)
+            if self.rendered.get(name) == key:
+                continue
+            try:
+                diagram.run_and_save(str(self.out_dir / f"{name}.svg"))
+            except Exception:
+                self.errors[path] = traceback.format_exc()
+                print(self.errors[path], file=sys.stderr)
+                continue
+            self.rendered[name] = key
+            count += 1
+
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{path}: rendered {count}/{len(diagrams)} diagrams in {elapsed:.0f}ms")
+
+    def write_state(self) -> None:
+        state = {"diagrams": self.rendered, "errors": list(self.errors.values())}
+        tmp = self.out_dir / "state.json.tmp"
+        tmp.write_text(json.dumps(state))
+        tmp.replace(self.out_dir / "state.json")
+
+    def run(self, interval: float) -> None:
+        while True:
+            changed_helpers = self.changed_helpers()
+            self.evict(changed_helpers)
+            changed = self.changed_paths(changed_helpers)
+            for path in changed:
+                self.refresh(path)
+            if changed:
+                self.write_state()
+            time.sleep(interval)
+
+
+def serve(out_dir: Path, port: int) -> ThreadingHTTPServer:
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    handler = partial(QuietHandler, directory=str(out_dir))
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Live preview of mathdiagrams modules")
+    parser.add_argument("files", nargs="+", type=Path, help="python files with diagrams")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--out", type=Path, default=None, help="directory for the SVGs")
+    parser.add_argument("--interval", type=float, default=0.1, help="poll interval (s)")
+    args = parser.parse_args()
+
+    out_dir = args.out
+    if out_dir is None:
+        out_dir = Path(tempfile.mkdtemp(prefix="mathdiagrams-"))
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    paths = [path.resolve() for path in args.files]
+    stems = [path.stem for path in paths]
+    if len(set(stems)) != len(stems):
+        parser.error(f"Watched files need distinct names, got {stems}")
+    for path in paths:
+        # let the watched modules import their neighbours
+        if str(path.parent) not in sys.path:
+            sys.path.insert(0, str(path.parent))
+
+    previewer = Previewer(paths, out_dir)
+    server = serve(out_dir, args.port)
+    print(f"Serving {out_dir} on http://127.0.0.1:{args.port}/")
+    try:
+        previewer.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()